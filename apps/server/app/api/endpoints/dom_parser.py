@@ -1,9 +1,6 @@
-import json
-
 from app.api.utils.dom_parser.processor import parse_dom
-from app.config import settings
-from app.models.dom import DOMHashMap
-from fastapi import APIRouter
+from app.models.dom import DOM_HASH_MAP_ADAPTER, DOMHashMap
+from fastapi import APIRouter, Response
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -13,8 +10,12 @@ class DOMParseRequest(BaseModel):
     html: str
 
 
-@router.post("/parse")
+@router.post("/parse", response_model=DOMHashMap)
 async def dom_parse(request: DOMParseRequest):
     """Parse the DOM state and return the updated DOM state"""
     parsed_dom_state = parse_dom(request.html)
-    return parsed_dom_state
+    # Serialize with the prebuilt adapter rather than FastAPI's jsonable_encoder walk
+    return Response(
+        content=DOM_HASH_MAP_ADAPTER.dump_json(parsed_dom_state),
+        media_type="application/json"
+    )
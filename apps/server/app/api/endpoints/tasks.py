@@ -1,4 +1,5 @@
-import json
+import asyncio
+import logging
 import os
 
 from app.api.services.storage_service import StorageService
@@ -10,16 +11,35 @@ from app.models.dom import DOMState, DOMUpdate, DOMUpdateResponse
 from app.models.tasks import TaskCreate, TaskResponse
 from fastapi import APIRouter, HTTPException
 
-from app.api.utils.llm import generate, generate_with_open_router
+from app.api.utils.llm import generate
 
 router = APIRouter()
 
+logger = logging.getLogger("tasks")
+
+
+def _save_prompt_snapshot(task_id: str, content: str):
+    """Write the prompt and LLM result sent for a task to the snapshots directory"""
+    try:
+        os.makedirs(settings.SNAPSHOTS_DIR, exist_ok=True)
+        snapshot_file = os.path.join(
+            settings.SNAPSHOTS_DIR, 
+            f"task_{task_id}_dom_snapshot_prompt.txt"
+        )
+        
+        with open(snapshot_file, "w", encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            
+    except Exception as e:
+        logger.error("Error saving snapshot: %s", e)
+
 
 @router.post("/create", response_model=TaskResponse)
 async def create_task(task: TaskCreate):
     """Create a new navigation task"""
     try:
-        return TaskService.create_task(task)
+        return await TaskService.create_task(task)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -28,16 +48,18 @@ async def create_task(task: TaskCreate):
 async def update_task(update: DOMUpdate):
     """Update a task with DOM data"""
     try:
-        files = StorageService.save_dom_snapshot(update)
+        # Disk writes run in a worker thread so they don't stall the event loop
+        files = await asyncio.to_thread(StorageService.save_dom_snapshot, update)
         dom_state = DOMState(
             url=update.dom_data.url,
             element_tree=update.structure
         )
         
-        task_text = TaskService.get_task(update.task_id)
+        task_text = await TaskService.get_task(update.task_id)
         
-        task_history = TaskService.get_task_history(update.task_id)
-        print(f"Retrieved history for task {update.task_id}: {len(task_history)} entries with {update.result} results")
+        task_history = await TaskService.get_task_history(update.task_id)
+        logger.debug("Retrieved history for task %s: %d entries with %s results",
+                     update.task_id, len(task_history), update.result)
         
         user_message, xpath_map, selector_map = build_user_message(
             dom_state=dom_state,
@@ -48,31 +70,22 @@ async def update_task(update: DOMUpdate):
 
         system_message = build_system_prompt()
         
-        result = generate(user_message, system_message)
+        result = await generate(user_message, system_message, update.task_id)
         processed_result = process_element_references(result, xpath_map, selector_map)
         
         if processed_result and hasattr(processed_result, "actions") and processed_result.actions:
-            print(f"Storing AI-generated actions for task {update.task_id}")
-            StorageService.append_task_history(update.task_id, {
+            logger.debug("Storing AI-generated actions for task %s", update.task_id)
+            await StorageService.append_task_history(update.task_id, {
                 "url": update.dom_data.url,
                 "timestamp": update.dom_data.timestamp,
                 "actions": [action.model_dump() for action in processed_result.actions]
             })
         
-        try:
-            os.makedirs(settings.SNAPSHOTS_DIR, exist_ok=True)
-            snapshot_file = os.path.join(
-                settings.SNAPSHOTS_DIR, 
-                f"task_{update.task_id}_dom_snapshot_prompt.txt"
-            )
-            
-            with open(snapshot_file, "w", encoding='utf-8') as f:
-                content = f"{system_message}\n\n{user_message}\n\n{processed_result.model_dump_json()}"
-                f.write(content)
-                f.flush()
-                
-        except Exception as e:
-            print(f"Error saving snapshot: {str(e)}")
+        await asyncio.to_thread(
+            _save_prompt_snapshot,
+            update.task_id,
+            f"{system_message}\n\n{user_message}\n\n{processed_result.model_dump_json()}"
+        )
 
         return DOMUpdateResponse(
             status="success",
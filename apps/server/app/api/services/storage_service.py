@@ -1,12 +1,18 @@
+import asyncio
 import json
+import logging
 import os
 from datetime import datetime
+from typing import Optional
 
-import redis
+import orjson
+import redis.asyncio as redis
 
 from app.config import settings
 from app.models.dom import DOMUpdate
 
+logger = logging.getLogger("storage")
+
 
 class StorageService:
     """Service for storing DOM snapshots and metadata"""
@@ -14,9 +20,14 @@ class StorageService:
     # Initialize Redis connection
     _redis_client = None
     
+    # Metadata files waiting for the background writer
+    _metadata_queue: Optional[asyncio.Queue] = None
+    _metadata_loop: Optional[asyncio.AbstractEventLoop] = None
+    _metadata_writer: Optional[asyncio.Task] = None
+    
     @classmethod
-    def get_redis(cls):
-        """Get or create Redis connection"""
+    def get_redis(cls) -> redis.Redis:
+        """Get or create the async Redis client (it connects lazily on first command)"""
         if cls._redis_client is None:
             cls._redis_client = redis.Redis(
                 host=settings.REDIS_HOST,
@@ -27,22 +38,40 @@ class StorageService:
             )
         return cls._redis_client
 
+    @classmethod
+    async def close_redis(cls):
+        """Close the Redis connection pool"""
+        if cls._redis_client is not None:
+            await cls._redis_client.aclose()
+            cls._redis_client = None
+
     @staticmethod
     def ensure_snapshots_directory():
         """Ensure the snapshots directory exists"""
         os.makedirs(settings.SNAPSHOTS_DIR, exist_ok=True)
 
+    @staticmethod
+    def timestamp_stamp(timestamp: str) -> str:
+        """Format an ISO timestamp as YYYYMMDD_HHMMSS for snapshot filenames"""
+        # The extension sends "YYYY-MM-DDTHH:MM:SS(.fff)Z", so slice it directly
+        if (len(timestamp) >= 19 and timestamp[4] == '-' and timestamp[7] == '-'
+                and timestamp[10] == 'T' and timestamp[13] == ':' and timestamp[16] == ':'):
+            stamp = (timestamp[0:4] + timestamp[5:7] + timestamp[8:10] + "_"
+                     + timestamp[11:13] + timestamp[14:16] + timestamp[17:19])
+            if stamp[:8].isdigit() and stamp[9:].isdigit():
+                return stamp
+
+        # Anything else goes through the full ISO parser
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        return parsed.strftime('%Y%m%d_%H%M%S')
+
     @classmethod
     def save_dom_snapshot(cls, update: DOMUpdate) -> dict:
         """Save DOM snapshot and metadata to disk"""
         cls.ensure_snapshots_directory()
 
-        # Parse timestamp
-        timestamp = datetime.fromisoformat(
-            update.dom_data.timestamp.replace('Z', '+00:00'))
-
         # Create base filename
-        base_filename = f"task_{update.task_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}"
+        base_filename = f"task_{update.task_id}_{cls.timestamp_stamp(update.dom_data.timestamp)}"
 
         # HTML file path
         html_filename = f"{settings.SNAPSHOTS_DIR}/{base_filename}.html"
@@ -64,17 +93,14 @@ class StorageService:
         # Metadata file path
         metadata_filename = f"{settings.SNAPSHOTS_DIR}/{base_filename}_metadata.json"
 
-        # Save metadata
-        with open(metadata_filename, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
+        # Queue metadata for the background writer
+        cls.queue_metadata(metadata_filename, metadata)
 
         # Save DOM structure if available
         if update.structure:
             structure_filename = f"{settings.SNAPSHOTS_DIR}/{base_filename}_structure.json"
-            with open(structure_filename, "w", encoding="utf-8") as f:
-                json.dump(update.structure, f, indent=2)
-
-        # print("Current update: ", update)
+            with open(structure_filename, "wb") as f:
+                f.write(orjson.dumps(update.structure, option=orjson.OPT_INDENT_2))
 
         # NOTE: We've moved the Redis history update to the tasks.py endpoint
         # to store the processed_result actions instead of update.result
@@ -85,6 +111,61 @@ class StorageService:
             "structure": f"{settings.SNAPSHOTS_DIR}/{base_filename}_structure.json" if update.structure else None
         }
         
+    @staticmethod
+    def _write_metadata(records: list):
+        """Write each queued (path, metadata) record to its own file"""
+        for path, metadata in records:
+            with open(path, "wb") as f:
+                f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+
+    @classmethod
+    def queue_metadata(cls, path: str, metadata: dict):
+        """Hand a metadata file to the background writer (safe from worker threads)"""
+        if cls._metadata_writer is None:
+            # No writer running (e.g. outside the app), so write it straight away
+            cls._write_metadata([(path, metadata)])
+            return
+        cls._metadata_loop.call_soon_threadsafe(cls._metadata_queue.put_nowait, (path, metadata))
+
+    @classmethod
+    def start_metadata_writer(cls):
+        """Start the background task that batches metadata writes"""
+        cls._metadata_queue = asyncio.Queue()
+        cls._metadata_loop = asyncio.get_running_loop()
+        cls._metadata_writer = asyncio.create_task(cls._run_metadata_writer(cls._metadata_queue))
+
+    @classmethod
+    async def stop_metadata_writer(cls):
+        """Flush queued metadata and stop the background writer"""
+        if cls._metadata_writer is None:
+            return
+        cls._metadata_queue.put_nowait(None)
+        await cls._metadata_writer
+        cls._metadata_queue = cls._metadata_loop = cls._metadata_writer = None
+
+    @classmethod
+    async def _run_metadata_writer(cls, queue: asyncio.Queue):
+        """Write queued metadata files, one worker-thread hop per batch"""
+        stopping = False
+        while not stopping:
+            batch = [await queue.get()]
+            # Give concurrent updates a moment to join this batch
+            await asyncio.sleep(settings.METADATA_FLUSH_INTERVAL)
+            while len(batch) < settings.METADATA_WRITE_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            # None is the stop signal; anything still queued joins the final batch
+            if None in batch:
+                stopping = True
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    await asyncio.to_thread(cls._write_metadata, records)
+                except Exception as e:
+                    logger.error("Error writing metadata files: %s", e)
+
     @classmethod
     def normalize_task_id(cls, task_id: str) -> str:
         """Normalize task ID to remove any prefix duplication"""
@@ -94,62 +175,60 @@ class StorageService:
         return f"{settings.REDIS_TASK_PREFIX}{task_id}"
     
     @classmethod
-    def store_task(cls, task_id: str, task_text: str) -> bool:
+    async def store_task(cls, task_id: str, task_text: str) -> bool:
         """Store a task in Redis"""
         normalized_id = cls.normalize_task_id(task_id)
         redis_key = f"{settings.REDIS_PREFIX}{normalized_id}"
-        print(f"Storing task with Redis key: {redis_key}")
-        return cls.get_redis().set(
+        logger.debug("Storing task with Redis key: %s", redis_key)
+        return await cls.get_redis().set(
             redis_key, 
             task_text,
             ex=settings.REDIS_TASK_TTL
         )
     
     @classmethod
-    def get_task(cls, task_id: str) -> str:
+    async def get_task(cls, task_id: str) -> str:
         """Get a task from Redis"""
         normalized_id = cls.normalize_task_id(task_id)
         redis_key = f"{settings.REDIS_PREFIX}{normalized_id}"
-        print(f"Getting task with Redis key: {redis_key}")
-        return cls.get_redis().get(redis_key)
+        logger.debug("Getting task with Redis key: %s", redis_key)
+        return await cls.get_redis().get(redis_key)
     
     @classmethod
-    def append_task_history(cls, task_id: str, action_data: dict) -> bool:
+    async def append_task_history(cls, task_id: str, action_data: dict) -> bool:
         """Append action history for a task"""
         normalized_id = cls.normalize_task_id(task_id)
         redis_key = f"{settings.REDIS_PREFIX}{settings.REDIS_TASK_HISTORY_PREFIX}{normalized_id}"
         redis_client = cls.get_redis()
         
-        print(f"Appending task history with Redis key: {redis_key}")
+        logger.debug("Appending task history with Redis key: %s", redis_key)
         
         try:
-            # Simply append the new item to the list (more efficient than recreating)
-            redis_client.rpush(redis_key, json.dumps(action_data))
-            
-            # check if added
-            history_list = redis_client.lrange(redis_key, 0, -1)
-            print(f"Added history item to Redis. Current history length: {len(history_list)}")
-            
-            # Make sure expiration is set
-            redis_client.expire(redis_key, settings.REDIS_TASK_TTL)
+            # Append the new item and refresh the expiration in one round trip;
+            # RPUSH returns the new length, so there's no need to read the list back
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.rpush(redis_key, json.dumps(action_data))
+                pipe.expire(redis_key, settings.REDIS_TASK_TTL)
+                history_length, _ = await pipe.execute()
+            logger.debug("Added history item to Redis. Current history length: %d", history_length)
             return True
         except Exception as e:
-            print(f"Error appending task history: {str(e)}")
+            logger.error("Error appending task history: %s", e)
             return False
     
     @classmethod
-    def get_task_history(cls, task_id: str) -> list:
+    async def get_task_history(cls, task_id: str) -> list:
         """Get action history for a task"""
         normalized_id = cls.normalize_task_id(task_id)
         redis_key = f"{settings.REDIS_PREFIX}{settings.REDIS_TASK_HISTORY_PREFIX}{normalized_id}"
         
-        print(f"Getting task history with Redis key: {redis_key}")
+        logger.debug("Getting task history with Redis key: %s", redis_key)
         
         try:
             redis_client = cls.get_redis()
-            history_list = redis_client.lrange(redis_key, 0, -1)
+            history_list = await redis_client.lrange(redis_key, 0, -1)
             
-            print(f"Found {len(history_list)} history entries for task {task_id}")
+            logger.debug("Found %d history entries for task %s", len(history_list), task_id)
             
             # Convert string items back to dicts with error handling
             history = []
@@ -158,10 +237,10 @@ class StorageService:
                     history.append(json.loads(item))
                 except json.JSONDecodeError:
                     # Skip invalid JSON entries
-                    print(f"Error decoding history item for task {task_id}")
+                    logger.warning("Error decoding history item for task %s", task_id)
                     continue
                     
             return history
         except Exception as e:
-            print(f"Error retrieving task history: {str(e)}")
+            logger.error("Error retrieving task history: %s", e)
             return []
@@ -1,5 +1,4 @@
 import uuid
-from datetime import datetime
 
 from app.api.services.storage_service import StorageService
 from app.models.tasks import TaskCreate, TaskResponse
@@ -9,13 +8,13 @@ class TaskService:
     """Service for handling tasks"""
 
     @staticmethod
-    def create_task(task: TaskCreate) -> TaskResponse:
+    async def create_task(task: TaskCreate) -> TaskResponse:
         """Create a new task"""
-        # Generate a unique task ID with timestamp
-        task_id = f"task_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        # Generate a unique task ID
+        task_id = uuid.uuid4().hex
 
         # Store task in Redis
-        StorageService.store_task(task_id, task.task)
+        await StorageService.store_task(task_id, task.task)
 
         return TaskResponse(
             task_id=task_id,
@@ -24,11 +23,11 @@ class TaskService:
         )
         
     @staticmethod
-    def get_task(task_id: str) -> str:
+    async def get_task(task_id: str) -> str:
         """Get a task from storage"""
-        return StorageService.get_task(task_id)
+        return await StorageService.get_task(task_id)
         
     @staticmethod
-    def get_task_history(task_id: str) -> list:
+    async def get_task_history(task_id: str) -> list:
         """Get task history from storage"""
-        return StorageService.get_task_history(task_id)
+        return await StorageService.get_task_history(task_id)
@@ -0,0 +1,47 @@
+import re
+
+# Fast-path checks: most ids, classes and attribute values need no escaping
+CSS_IDENT_RE = re.compile(r'-?[A-Za-z_][\w-]*')
+CSS_UNSAFE_VALUE_RE = re.compile(r"['\\\x00-\x1f\x7f]")
+
+
+def _is_control(char: str) -> bool:
+    return '\x01' <= char <= '\x1f' or char == '\x7f'
+
+
+def css_ident(value: str) -> str:
+    """Escape an id or class name for use in a CSS selector (CSSOM serialize-an-identifier)."""
+    if CSS_IDENT_RE.fullmatch(value):
+        return value
+    if value == '-':
+        return '\\-'
+    escaped = []
+    for i, char in enumerate(value):
+        if char == '\0':
+            escaped.append('\ufffd')
+        elif _is_control(char) or (
+            '0' <= char <= '9' and (i == 0 or (i == 1 and value[0] == '-'))
+        ):
+            escaped.append(f"\\{ord(char):x} ")
+        elif not char.isascii() or char.isalnum() or char in '_-':
+            escaped.append(char)
+        else:
+            escaped.append(f"\\{char}")
+    return ''.join(escaped)
+
+
+def css_string(value: str) -> str:
+    """Quote an attribute value for a CSS attribute selector (CSSOM serialize-a-string)."""
+    if not CSS_UNSAFE_VALUE_RE.search(value):
+        return f"'{value}'"
+    escaped = []
+    for char in value:
+        if char == '\0':
+            escaped.append('\ufffd')
+        elif _is_control(char):
+            escaped.append(f"\\{ord(char):x} ")
+        elif char in "'\\":
+            escaped.append(f"\\{char}")
+        else:
+            escaped.append(char)
+    return f"'{''.join(escaped)}'"
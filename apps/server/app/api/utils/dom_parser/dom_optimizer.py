@@ -1,10 +1,17 @@
 import logging
+import re
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
+from app.api.utils.dom_parser.css import css_ident, css_string
 from app.api.utils.llm import GenerateResponse
 
 logger = logging.getLogger("dom-mapper")
 
+# Action fields that may carry an element reference, in priority order
+_REF_FIELDS = ('element_id', 'xpath_ref')
+# Element references as the LLM writes them: "E5", "[E5]", "e5" or a bare "5"
+_ELEMENT_REF_RE = re.compile(r'^\[?E?(\d+)\]?$', re.IGNORECASE)
+
 class HighlightStyleMapper:
     """
     Creates a DOM representation similar to the clickable_elements_to_string method
@@ -272,20 +279,20 @@ class HighlightStyleMapper:
         selector = tag_name
         
         if 'id' in attributes and attributes['id']:
-            return f"#{attributes['id']}"
+            return f"#{css_ident(attributes['id'])}"
         
         for attr in ['data-testid', 'data-cy', 'data-test', 'data-qa']:
             if attr in attributes and attributes[attr]:
-                return f"[{attr}='{attributes[attr]}']"
+                return f"[{attr}={css_string(attributes[attr])}]"
         
         if tag_name == 'input':
             selector_parts = [tag_name]
             
             if 'type' in attributes:
-                selector_parts.append(f"[type='{attributes['type']}']")
+                selector_parts.append(f"[type={css_string(attributes['type'])}]")
                 
             if 'name' in attributes:
-                selector_parts.append(f"[name='{attributes['name']}']")
+                selector_parts.append(f"[name={css_string(attributes['name'])}]")
                 
             if len(selector_parts) > 1:
                 return ''.join(selector_parts)
@@ -293,13 +300,13 @@ class HighlightStyleMapper:
         if tag_name == 'a' and 'href' in attributes:
             href = attributes['href']
             if len(href) < 50 and not href.startswith('javascript:'):
-                return f"a[href='{href}']"
+                return f"a[href={css_string(href)}]"
         
         if 'class' in attributes and attributes['class']:
             classes = attributes['class'].split()
             specific_classes = [c for c in classes if len(c) > 3 and not c.startswith('js-')]
             if specific_classes:
-                return f"{tag_name}.{specific_classes[0]}"
+                return f"{tag_name}.{css_ident(specific_classes[0])}"
         
         parent_id = self.parent_map.get(elem_id)
         if parent_id and parent_id in dom_hashmap:
@@ -309,7 +316,7 @@ class HighlightStyleMapper:
                 
                 parent_attrs = self._get_attr(parent, 'attributes', {})
                 if 'id' in parent_attrs and parent_attrs['id']:
-                    return f"#{parent_attrs['id']} > {selector}"
+                    return f"#{css_ident(parent_attrs['id'])} > {selector}"
                 
                 siblings = []
                 parent_children = self._get_attr(parent, 'children', [])
@@ -347,28 +354,33 @@ def generate_highlight_style_dom(dom_state, include_attributes=None):
     return highlight_repr, xpath_map, selector_map
 
 
+def _extract_element_ref(action) -> Optional[str]:
+    """Get the first element reference set on an action, normalized to an E-id."""
+    for field in _REF_FIELDS:
+        if not (value := getattr(action, field, None)):
+            continue
+        if (match := _ELEMENT_REF_RE.match(value.strip())):
+            return f"E{match.group(1)}"
+        return value
+    return None
+
+
 def process_element_references(response_json: GenerateResponse, xpath_map, selector_map):
     """Process element references in LLM response to map them to XPaths or selectors."""
-    if not response_json or not hasattr(response_json, 'actions'):
+    # Nothing to resolve against (page without targets) or nothing to resolve
+    if not response_json or not (xpath_map or selector_map):
+        return response_json
+    actions = getattr(response_json, 'actions', None)
+    if not actions:
         return response_json
-        
-    actions = response_json.actions
     
     for action in actions:
-        if hasattr(action, 'element_id') and action.element_id:
-            element_id = action.element_id
-            
-            if element_id in xpath_map:
-                action.xpath_ref = xpath_map[element_id]
-                
-            if element_id in selector_map:
-                action.selector = selector_map[element_id]
+        if not (element_id := _extract_element_ref(action)):
+            continue
         
-        elif hasattr(action, 'xpath_ref') and action.xpath_ref:
-            element_id = action.xpath_ref
-            if element_id in xpath_map:
-                action.xpath = xpath_map[element_id]
-            if element_id in selector_map:
-                action.selector = selector_map[element_id]
+        if (xpath := xpath_map.get(element_id)):
+            action.xpath_ref = xpath
+        if (selector := selector_map.get(element_id)):
+            action.selector = selector
     
-    return response_json
\ No newline at end of file
+    return response_json
@@ -2,7 +2,6 @@ import logging
 
 from bs4 import NavigableString, Tag
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("DOM-Analyzer")
 logger.setLevel(logging.INFO)
 
@@ -16,17 +15,13 @@ def tag_wise_filter(element_tag: str) -> bool:
     """Filter elements based on their tag name."""
     try:
         if not element_tag:
-            logger.debug("Empty element tag provided to tag_wise_filter")
             return False
 
         normalized_tag = element_tag.lower()
-        logger.debug(f"Checking tag filter for: {normalized_tag}")
 
         if normalized_tag in unaccepted_leaf_element_tags_set:
-            logger.debug(f"Tag {normalized_tag} is in unaccepted set")
             return False
 
-        logger.debug(f"Tag {normalized_tag} is accepted")
         return True
     except Exception as error:
         logger.error(f"Error in tag_wise_filter: {error}")
@@ -39,12 +34,8 @@ def is_element_visible(element: Tag) -> bool:
     """
     try:
         if not element:
-            logger.debug("Null element provided to is_element_visible")
             return False
 
-        tag_name = element.name.lower() if element.name else ""
-        logger.debug(f"Checking visibility for {tag_name}")
-
         style_attr = element.get('style', '')
         if 'display:none' in style_attr.lower() or 'visibility:hidden' in style_attr.lower():
             return False
@@ -59,7 +50,6 @@ def is_element_visible(element: Tag) -> bool:
         if any(hidden_class in class_name.lower() for class_name in class_names for hidden_class in hidden_classes):
             return False
 
-        logger.debug(f"Element visibility result: True")
         return True
     except Exception as error:
         logger.error(f"Error in is_element_visible: {error}")
@@ -72,11 +62,9 @@ def is_top_element(element: Tag) -> bool:
     """
     try:
         if not element:
-            logger.debug("Null element provided to is_top_element")
             return False
 
         tag_name = element.name.lower() if element.name else ""
-        logger.debug(f"Checking if {tag_name} is top element")
 
         if tag_name in ['body', 'html']:
             return False
@@ -94,11 +82,8 @@ def is_text_node_visible(text_node: NavigableString) -> bool:
     """Check if a text node is likely visible."""
     try:
         if not text_node or not text_node.strip():
-            logger.debug("Null or empty text node provided")
             return False
 
-        logger.debug("Checking text node visibility")
-
         parent = text_node.parent
         if not parent or not is_element_visible(parent):
             return False
@@ -112,14 +97,11 @@ def is_interactive_element(element: Tag) -> bool:
     """Check if an element is interactive based on its tag and attributes."""
     try:
         if not element:
-            logger.debug("Null element provided to is_interactive_element")
             return False
 
         tag_name = element.name.lower() if element.name else ""
-        logger.debug(f"Checking if {tag_name} is interactive")
 
         if tag_name == "body":
-            logger.debug("Body tag is not interactive")
             return False
 
         interactive_elements = {
@@ -159,7 +141,6 @@ def is_interactive_element(element: Tag) -> bool:
         )
 
         if has_interactive_role:
-            logger.debug(f"Element has interactive role: {tag_name}")
             return True
 
         has_click_handler = (
@@ -179,8 +160,6 @@ def is_interactive_element(element: Tag) -> bool:
         is_draggable = element.get('draggable') == "true"
 
         if tag_name == "body" or parent_tag == "body":
-            logger.debug(
-                "Element is body or direct child of body - not interactive")
             return False
 
         is_interactive = (
@@ -189,8 +168,6 @@ def is_interactive_element(element: Tag) -> bool:
             is_draggable
         )
 
-        logger.debug(
-            f"Element interactivity: {is_interactive} (ariaProps: {has_aria_props}, clickHandler: {has_click_handler}, draggable: {is_draggable})")
         return is_interactive
     except Exception as error:
         logger.error(f"Error in is_interactive_element: {error}")
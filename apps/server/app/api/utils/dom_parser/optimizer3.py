@@ -1,9 +1,43 @@
 import logging
+import threading
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
+from app.api.utils.dom_parser.css import css_ident, css_string
+
 logger = logging.getLogger("dom-mapper")
 logger.setLevel(logging.INFO)
 
+_INTERACTIVE_TAGS = frozenset({'input', 'select', 'textarea', 'button', 'a'})
+_FORM_ELEMENT_TAGS = frozenset({'input', 'textarea', 'select'})
+# Ordered: the first present attribute labels an empty form element
+_FORM_TEXT_ATTRS = ('placeholder', 'aria-label', 'title')
+_TEST_ID_ATTRS = ('data-testid', 'data-cy', 'data-test', 'data-qa')
+
+# Attributes that identify an element on their own, most specific first:
+# (attribute, selector prefix, value escaper, selector suffix)
+_SELECTOR_PRIORITY = (('id', '#', css_ident, ''),) + tuple(
+    (attr, f"[{attr}=", css_string, ']') for attr in _TEST_ID_ATTRS
+)
+
+
+# Specialized accessors; a DOM is homogeneous (all dicts or all node
+# models), so the representation is checked once per mapping run.
+def _dict_get_attr(element: Dict, attr_name: str, default=None):
+    return element.get(attr_name, default)
+
+
+def _obj_get_attr(element: Any, attr_name: str, default=None):
+    return getattr(element, attr_name, default)
+
+
+def _dict_is_text_node(element: Dict) -> bool:
+    return element.get('type') == 'TEXT_NODE'
+
+
+def _obj_is_text_node(element: Any) -> bool:
+    return getattr(element, 'type', None) == 'TEXT_NODE'
+
+
 class EnhancedHighlightStyleMapper:
     """
     Creates a DOM representation with highlight indices, with special handling
@@ -27,7 +61,18 @@ class EnhancedHighlightStyleMapper:
         self.xpath_map = {}
         self.selector_map = {}
         self.parent_map = {}
+        # Children of each element resolved to their dom_hashmap keys
+        self.child_keys = {}
         self.interactive_elements = set()
+        # Interactive elements in E-id order, kept as parallel lists
+        self.ie_ids = []
+        self.ie_elems = []
+        self.ie_tags = []
+        self.body_id = None
+        self.html_id = None
+        # Scratch set for the text walk, cleared per call instead of reallocated
+        self._visited = set()
+        self._include_set = frozenset(self.include_attributes)
         self.max_text_length = 500
 
     def create_highlight_representation(self, dom_hashmap: Dict) -> Tuple[str, Dict, Dict]:
@@ -40,29 +85,27 @@ class EnhancedHighlightStyleMapper:
         if not dom_hashmap:
             return "No elements found on page", {}, {}
         
-        self.element_map = {}
-        self.xpath_map = {}
-        self.selector_map = {}
-        self.parent_map = {}
-        self.interactive_elements = set()
-        self.next_id = 1
+        self.reset()
+        self._bind_accessors(next(iter(dom_hashmap.values())))
+        # include_attributes may be swapped between runs; test membership in
+        # a set built once per run rather than scanning the list per attribute
+        self._include_set = frozenset(self.include_attributes or ())
         
-        self._preprocess_dom(dom_hashmap)
+        # Invisible subtrees (hidden modals, templates) never produce output,
+        # so formatting works on the visible-only view returned here.
+        visible_map = self._preprocess_dom(dom_hashmap)
         
         root_id = self._find_root_element(dom_hashmap)
         if not root_id:
             return "Could not determine root element", {}, {}
         
-        output_lines = []
+        # Every element writes its fragments into one buffer, joined once
+        output_parts = []
         
-        for elem_id in sorted(self.interactive_elements, key=lambda x: int(self.element_map[x][1:])):
-            element = dom_hashmap.get(elem_id)
-            if not element or self._is_text_node(element):
-                continue
-                
-            element_line = self._format_interactive_element(elem_id, element, dom_hashmap)
-            if element_line:
-                output_lines.append(element_line)
+        ie_elems = self.ie_elems
+        ie_tags = self.ie_tags
+        for i, elem_id in enumerate(self.ie_ids):
+            self._format_interactive_element(elem_id, ie_elems[i], ie_tags[i], visible_map, output_parts)
         
         # standalone_text = self._extract_standalone_text(dom_hashmap)
         # if standalone_text:
@@ -71,12 +114,40 @@ class EnhancedHighlightStyleMapper:
         #     output_lines.append("# Additional Page Text")
         #     output_lines.extend(standalone_text)
         
-        if not output_lines:
+        if not output_parts:
             return "No interactive elements found on page", {}, {}
-            
-        output = "\n".join(output_lines)
+        
+        output_parts.pop()  # trailing line break
+        output = "".join(output_parts)
         return output, self.xpath_map, self.selector_map
     
+    def reset(self):
+        """Clear per-run state so one mapper can be reused across calls."""
+        self.element_map.clear()
+        self.parent_map.clear()
+        self.child_keys.clear()
+        self.interactive_elements.clear()
+        self.ie_ids.clear()
+        self.ie_elems.clear()
+        self.ie_tags.clear()
+        self._visited.clear()
+        self.body_id = None
+        self.html_id = None
+        self.next_id = 1
+        # The xpath/selector maps are returned to the caller, so each run gets
+        # fresh ones rather than clearing dicts that may still be in use.
+        self.xpath_map = {}
+        self.selector_map = {}
+
+    def _bind_accessors(self, sample: Any):
+        """Bind _get_attr/_is_text_node to fast paths for the DOM's node representation."""
+        if isinstance(sample, dict):
+            self._get_attr = _dict_get_attr
+            self._is_text_node = _dict_is_text_node
+        else:
+            self._get_attr = _obj_get_attr
+            self._is_text_node = _obj_is_text_node
+
     def _is_text_node(self, element: Any) -> bool:
         """Check if element is a text node."""
         if hasattr(element, 'type'):
@@ -93,69 +164,98 @@ class EnhancedHighlightStyleMapper:
             return element.get(attr_name, default)
         return default
         
-    def _preprocess_dom(self, dom_hashmap: Dict):
-        """Build parent mapping and identify interactive elements."""
+    def _preprocess_dom(self, dom_hashmap: Dict) -> Dict:
+        """
+        Single pass over the DOM: collect the visible nodes, build the parent
+        mapping, resolve child ids (ints or strings) to dom_hashmap keys,
+        identify visible interactive elements and note body/html root
+        candidates. Selectors need the complete parent mapping, so they are
+        generated afterwards for the interactive elements only.
+        
+        Returns:
+            The visible-only view of dom_hashmap
+        """
+        get_attr = self._get_attr
+        is_text_node = self._is_text_node
+        parent_map = self.parent_map
+        child_keys = self.child_keys
+        element_map = self.element_map
+        interactive_elements = self.interactive_elements
+        ie_ids = self.ie_ids
+        ie_elems = self.ie_elems
+        ie_tags = self.ie_tags
+        visible_map = {}
+        
         for elem_id, element in dom_hashmap.items():
-            if self._is_text_node(element):
+            is_visible = get_attr(element, 'isVisible', False)
+            if is_visible:
+                visible_map[elem_id] = element
+                
+            if is_text_node(element):
                 continue
                 
-            children = self._get_attr(element, 'children', [])
-            for child_id in children:
+            keys = []
+            for child_id in get_attr(element, 'children', []):
                 child_id_str = str(child_id)
-                if child_id_str not in dom_hashmap and child_id not in dom_hashmap:
+                if child_id_str in dom_hashmap:
+                    keys.append(child_id_str)
+                elif child_id in dom_hashmap:
+                    keys.append(child_id)
+                else:
                     continue
-                self.parent_map[child_id_str] = elem_id
-        
-        for elem_id, element in dom_hashmap.items():
-            if self._is_text_node(element):
-                continue
-                
-            is_visible = self._get_attr(element, 'isVisible', False)
+                parent_map[child_id_str] = elem_id
+            child_keys[elem_id] = keys
+            
+            # Tag names arrive lowercase: the extension's dom-analyzer (packages/core)
+            # and parse_dom both lowercase tagName when building the tree
+            tag_name = get_attr(element, 'tagName', '')
+            if tag_name == 'body':
+                if self.body_id is None:
+                    self.body_id = elem_id
+            elif tag_name == 'html':
+                if self.html_id is None:
+                    self.html_id = elem_id
+            
             if not is_visible:
                 continue
                 
-            is_interactive = self._get_attr(element, 'isInteractive', False)
-            tag_name = self._get_attr(element, 'tagName', '').lower()
-            
-            form_tags = ['input', 'select', 'textarea', 'button', 'a']
-            if is_interactive or tag_name in form_tags:
-                element_id = f"E{self.next_id}"
+            if get_attr(element, 'isInteractive', False) or tag_name in _INTERACTIVE_TAGS:
+                element_map[elem_id] = f"E{self.next_id}"
                 self.next_id += 1
-                
-                self.element_map[elem_id] = element_id
-                self.interactive_elements.add(elem_id)
-                
-                xpath = self._get_attr(element, 'xpath', '')
-                if xpath:
-                    self.xpath_map[element_id] = xpath
-                
-                attributes = self._get_attr(element, 'attributes', {})
-                selector = self._generate_selector(tag_name, attributes, dom_hashmap, elem_id)
-                if selector:
-                    self.selector_map[element_id] = selector
+                interactive_elements.add(elem_id)
+                ie_ids.append(elem_id)
+                ie_elems.append(element)
+                ie_tags.append(tag_name)
+        
+        xpath_map = self.xpath_map
+        selector_map = self.selector_map
+        
+        for i, elem_id in enumerate(ie_ids):
+            element = ie_elems[i]
+            element_id = element_map[elem_id]
+            
+            xpath = get_attr(element, 'xpath', '')
+            if xpath:
+                xpath_map[element_id] = xpath
+            
+            attributes = get_attr(element, 'attributes', {})
+            selector = self._generate_selector(ie_tags[i], attributes, dom_hashmap, elem_id)
+            if selector:
+                selector_map[element_id] = selector
+        
+        return visible_map
     
     def _find_root_element(self, dom_hashmap: Dict) -> Optional[str]:
         """Find the root element (body or html) in the DOM."""
-        for elem_id, element in dom_hashmap.items():
-            if self._is_text_node(element):
-                continue
-
-            tag_name = self._get_attr(element, 'tagName', '').lower()
-            if tag_name == 'body':
-                return elem_id
-
-        for elem_id, element in dom_hashmap.items():
-            if self._is_text_node(element):
-                continue
-
-            tag_name = self._get_attr(element, 'tagName', '').lower()
-            if tag_name == 'html':
-                return elem_id
-                
+        if self.body_id is not None:
+            return self.body_id
+        if self.html_id is not None:
+            return self.html_id
+            
         for elem_id in dom_hashmap:
             if elem_id not in self.parent_map:
                 return elem_id
-                
+            
         if dom_hashmap:
             return next(iter(dom_hashmap))
             
@@ -173,87 +273,94 @@ class EnhancedHighlightStyleMapper:
     def _get_text_till_next_highlighted(self, elem_id: str, dom_hashmap: Dict) -> str:
         """
         Get all text from this element until the next highlighted element.
-        Uses a fixed max_depth to prevent infinite recursion but ensure we
-        capture deeply nested text.
+        Uses a fixed max_depth to prevent runaway traversal but ensure we
+        capture deeply nested text. Walks with an explicit stack, so deep
+        DOMs cost no Python frames.
         """
         text_parts = []
-        visited = set()
-        
-        def collect_text(node_id: str, current_depth: int) -> None:
-            if current_depth > self.max_depth:
-                return
+        visited = self._visited
+        visited.clear()
+        visited_add = visited.add
+        stack = [(elem_id, 0)]
+        get_attr = self._get_attr
+        is_text_node = self._is_text_node
+        child_keys = self.child_keys
+        interactive_elements = self.interactive_elements
+        max_depth = self.max_depth
+        max_text_length = self.max_text_length
+        
+        while stack:
+            node_id, current_depth = stack.pop()
+            if current_depth > max_depth:
+                continue
                 
             if node_id in visited or node_id not in dom_hashmap:
-                return
+                continue
                 
-            visited.add(node_id)
+            visited_add(node_id)
             node = dom_hashmap[node_id]
             
-            if node_id != elem_id and node_id in self.interactive_elements:
-                return
+            if node_id != elem_id and node_id in interactive_elements:
+                continue
                 
-            if self._is_text_node(node) and self._get_attr(node, 'isVisible', False):
-                text = self._get_attr(node, 'text', '').strip()
-                if text:
-                    text_parts.append(text)
-            elif not self._is_text_node(node):
-                children = self._get_attr(node, 'children', [])
-                for child_id in children:
-                    child_id_str = str(child_id)
-                    child_key = None
-                    
-                    if child_id_str in dom_hashmap:
-                        child_key = child_id_str
-                    elif child_id in dom_hashmap:
-                        child_key = child_id
-                        
-                    if child_key:
-                        collect_text(child_key, current_depth + 1)
-        
-        collect_text(elem_id, 0)
+            if is_text_node(node):
+                if get_attr(node, 'isVisible', False):
+                    text = get_attr(node, 'text', '')
+                    # Most text is already trimmed; only strip when an end is whitespace
+                    if text and (text[0].isspace() or text[-1].isspace()):
+                        text = text.strip()
+                    if text:
+                        text_parts.append(text)
+                continue
+                
+            # Push in reverse so children pop in document order
+            next_depth = current_depth + 1
+            for child_key in reversed(child_keys.get(node_id, ())):
+                stack.append((child_key, next_depth))
         
-        text = ' '.join(text_parts).strip()
+        # Parts are trimmed and non-empty, so the joined text needs no strip
+        text = ' '.join(text_parts)
         
-        if text and len(text) > self.max_text_length:
-            text = text[:self.max_text_length - 3] + "..."
+        if len(text) > max_text_length:
+            text = f"{text[:max_text_length - 3]}..."
             
         return text
 
-    def _is_form_element(self, element: Any) -> bool:
-        """Check if an element is a form element that needs special handling."""
-        tag_name = self._get_attr(element, 'tagName', '').lower()
-        return tag_name in ['input', 'textarea', 'select']
-    
-    def _format_interactive_element(self, elem_id: str, element: Any, dom_hashmap: Dict) -> str:
-        """Format an interactive element in the highlight style."""
+    def _format_interactive_element(self, elem_id: str, element: Any, tag_name: str,
+                                    visible_map: Dict, parts: List[str]) -> bool:
+        """Append an interactive element's highlight-style line to parts."""
         element_id = self.element_map.get(elem_id)
         if not element_id:
-            return None
+            return False
             
-        tag_name = self._get_attr(element, 'tagName', '').lower()
         attributes = self._get_attr(element, 'attributes', {})
         
-        element_text = self._get_text_till_next_highlighted(elem_id, dom_hashmap)
+        element_text = self._get_text_till_next_highlighted(elem_id, visible_map)
         
         attributes_str = ''
-        is_form_element = self._is_form_element(element)
+        is_form_element = tag_name in _FORM_ELEMENT_TAGS
         
         if self.include_attributes:
             attr_values = []
             
             if is_form_element:
                 for key in self.form_element_attributes:
-                    if key in attributes and attributes[key]:
-                        attr_values.append(f"{key}={attributes[key]}")
+                    value = attributes.get(key)
+                    if value:
+                        attr_values.append(f"{key}={value}")
                 
-                if tag_name == 'input' and 'type' in attributes:
-                    attr_values.append(attributes['type'])
+                if tag_name == 'input':
+                    input_type = attributes.get('type')
+                    if input_type is not None:
+                        attr_values.append(input_type)
                 
-                if 'value' in attributes and attributes['value']:
-                    attr_values.append(f"value='{attributes['value']}'")
+                value = attributes.get('value')
+                if value:
+                    attr_values.append(f"value='{value}'")
             else:
+                include_set = self._include_set
                 for key, value in attributes.items():
-                    if key in self.include_attributes and value and value != tag_name:
+                    if key in include_set and value and value != tag_name:
                         if not (isinstance(value, str) and element_text and 
                                 (value == element_text or value in element_text)):
                             attr_values.append(str(value))
@@ -261,16 +368,16 @@ class EnhancedHighlightStyleMapper:
             if attr_values:
                 attributes_str = ' '.join(attr_values)
         
-        line = f"[{element_id}]<{tag_name} "
+        parts += ("[", element_id, "]<", tag_name, " ")
         
         if attributes_str:
-            line += f"{attributes_str}"
+            parts.append(attributes_str)
             
         if is_form_element and not element_text:
             form_text = None
-            for attr in ['placeholder', 'aria-label', 'title']:
-                if attr in attributes and attributes[attr]:
-                    form_text = attributes[attr]
+            for attr in _FORM_TEXT_ATTRS:
+                form_text = attributes.get(attr)
+                if form_text:
                     break
                     
             if form_text:
@@ -278,18 +385,18 @@ class EnhancedHighlightStyleMapper:
         
         if element_text:
             if attributes_str:
-                line += f">{element_text}"
-            else:
-                line += f"{element_text}"
+                parts.append(">")
+            parts.append(element_text)
                 
-        line += "/>"
+        parts += ("/>", "\n")
         
-        return line
+        return True
     
     def _extract_standalone_text(self, dom_hashmap: Dict) -> List[str]:
         """Extract important text content not part of interactive elements."""
         text_sections = []
         text_nodes_processed = set()
+        max_text_length = self.max_text_length
         
         for elem_id, element in dom_hashmap.items():
             if not self._is_text_node(element) or not self._get_attr(element, 'isVisible', False):
@@ -302,12 +409,14 @@ class EnhancedHighlightStyleMapper:
                 text_nodes_processed.add(elem_id)
                 continue
                 
-            text = self._get_attr(element, 'text', '').strip()
-            if not text or len(text) < 15:
+            text = self._get_attr(element, 'text', '')
+            if text and (text[0].isspace() or text[-1].isspace()):
+                text = text.strip()
+            if len(text) < 15:
                 continue
                 
-            if len(text) > self.max_text_length:
-                text = text[:self.max_text_length] + "..."
+            if len(text) > max_text_length:
+                text = f"{text[:max_text_length]}..."
             
             text_sections.append(f"- {text}")
             text_nodes_processed.add(elem_id)
@@ -320,68 +429,56 @@ class EnhancedHighlightStyleMapper:
             return ""
             
         selector = tag_name
+        get = attributes.get
         
-        if 'id' in attributes and attributes['id']:
-            return f"#{attributes['id']}"
-        
-        for attr in ['data-testid', 'data-cy', 'data-test', 'data-qa']:
-            if attr in attributes and attributes[attr]:
-                return f"[{attr}='{attributes[attr]}']"
+        for attr, prefix, escape, suffix in _SELECTOR_PRIORITY:
+            if (value := get(attr)):
+                return f"{prefix}{escape(value)}{suffix}"
         
         if tag_name == 'input':
             selector_parts = [tag_name]
             
-            if 'type' in attributes:
-                selector_parts.append(f"[type='{attributes['type']}']")
+            if (input_type := get('type')) is not None:
+                selector_parts.append(f"[type={css_string(input_type)}]")
                 
-            if 'name' in attributes:
-                selector_parts.append(f"[name='{attributes['name']}']")
+            if (name := get('name')) is not None:
+                selector_parts.append(f"[name={css_string(name)}]")
                 
             if len(selector_parts) > 1:
                 return ''.join(selector_parts)
         
-        if tag_name == 'a' and 'href' in attributes:
-            href = attributes['href']
+        if tag_name == 'a' and (href := get('href')) is not None:
             if len(href) < 50 and not href.startswith('javascript:'):
-                return f"a[href='{href}']"
+                return f"a[href={css_string(href)}]"
         
-        if 'class' in attributes and attributes['class']:
-            classes = attributes['class'].split()
+        if (class_attr := get('class')):
+            classes = class_attr.split()
             specific_classes = [c for c in classes if len(c) > 3 and not c.startswith('js-')]
             if specific_classes:
-                return f"{tag_name}.{specific_classes[0]}"
+                return f"{tag_name}.{css_ident(specific_classes[0])}"
         
         parent_id = self.parent_map.get(elem_id)
-        if parent_id and parent_id in dom_hashmap:
+        if parent_id:
             parent = dom_hashmap.get(parent_id)
             if parent:
-                parent_tag = self._get_attr(parent, 'tagName', '').lower()
+                parent_tag = self._get_attr(parent, 'tagName', '')
                 
                 parent_attrs = self._get_attr(parent, 'attributes', {})
                 if 'id' in parent_attrs and parent_attrs['id']:
-                    return f"#{parent_attrs['id']} > {selector}"
+                    return f"#{css_ident(parent_attrs['id'])} > {selector}"
                 
                 siblings = []
-                parent_children = self._get_attr(parent, 'children', [])
-                
-                for child_id in parent_children:
-                    child_id_str = str(child_id)
-                    child = None
-                    if child_id_str in dom_hashmap:
-                        child = dom_hashmap[child_id_str]
-                    elif child_id in dom_hashmap:
-                        child = dom_hashmap[child_id]
-                        
+                for child_key in self.child_keys.get(parent_id, ()):
+                    child = dom_hashmap[child_key]
                     if child and not self._is_text_node(child):
-                        child_tag = self._get_attr(child, 'tagName', '').lower()
+                        child_tag = self._get_attr(child, 'tagName', '')
                         if child_tag == tag_name:
-                            siblings.append(str(child_id))
+                            siblings.append(child_key)
                 
                 if siblings:
                     try:
-                        elem_id_str = str(elem_id)
-                        if elem_id_str in siblings:
-                            position = siblings.index(elem_id_str) + 1
+                        if elem_id in siblings:
+                            position = siblings.index(elem_id) + 1
                             if position > 0:
                                 return f"{parent_tag} > {selector}:nth-of-type({position})"
                     except ValueError:
@@ -390,6 +487,18 @@ class EnhancedHighlightStyleMapper:
         return selector
 
 
+_LOCAL = threading.local()
+
+
+def _get_mapper() -> EnhancedHighlightStyleMapper:
+    """Get this thread's mapper instance, creating it on first use."""
+    mapper = getattr(_LOCAL, 'enhanced', None)
+    if mapper is None:
+        mapper = EnhancedHighlightStyleMapper()
+        _LOCAL.enhanced = mapper
+    return mapper
+
+
 def generate_enhanced_highlight_dom(dom_state, include_attributes=None, max_depth=10):
     """Generate a highlight-style DOM representation with improved form element handling."""
     if include_attributes is None:
@@ -398,6 +507,12 @@ def generate_enhanced_highlight_dom(dom_state, include_attributes=None, max_dept
             'aria-label', 'aria-placeholder', 'role', 'title'
         ]
         
-    mapper = EnhancedHighlightStyleMapper(include_attributes=include_attributes, max_depth=max_depth)
-    highlight_repr, xpath_map, selector_map = mapper.create_highlight_representation(dom_state.element_tree)
+    mapper = _get_mapper()
+    mapper.include_attributes = include_attributes
+    mapper.max_depth = max_depth
+    try:
+        highlight_repr, xpath_map, selector_map = mapper.create_highlight_representation(dom_state.element_tree)
+    finally:
+        # Don't keep this DOM alive on the thread until its next request
+        mapper.reset()
     return highlight_repr, xpath_map, selector_map
@@ -1,4 +1,6 @@
 import logging
+import sys
+from collections import Counter
 
 from app.api.utils.dom_parser.filters import (is_element_visible,
                                               is_interactive_element,
@@ -7,9 +9,12 @@ from app.api.utils.dom_parser.filters import (is_element_visible,
 from app.models.dom import DOMElementNode, DOMHashMap, DOMTextNode
 from bs4 import BeautifulSoup, NavigableString, Tag
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("DOM-Analyzer")
 
+# Tag and attribute names repeat across every node; interning them shares one
+# string per name and lets the mappers' dict lookups hit on identity.
+_intern = sys.intern
+
 
 def get_xpath_for_element(element: Tag) -> str:
     """Generate an XPath for an element."""
@@ -40,6 +45,27 @@ def get_xpath_for_element(element: Tag) -> str:
         return "/unknown"
 
 
+def _child_frames(node: Tag, element_node: DOMElementNode, xpath: str) -> list:
+    """Pair each child of node with its parent element and, for tags, its XPath."""
+    children = node.contents
+    tag_names = [child.name.lower() if isinstance(child, Tag) else None
+                 for child in children]
+    totals = Counter(tag_names)
+    seen = {}
+    frames = []
+    for child, tag_name in zip(children, tag_names):
+        if tag_name is None:
+            frames.append((child, element_node, None))
+            continue
+        # Index only tags that have same-named siblings, as XPath does
+        if totals[tag_name] > 1:
+            seen[tag_name] = index = seen.get(tag_name, 0) + 1
+            frames.append((child, element_node, f"{xpath}/{tag_name}[{index}]"))
+        else:
+            frames.append((child, element_node, f"{xpath}/{tag_name}"))
+    return frames
+
+
 def parse_dom(html_content: str) -> DOMHashMap:
     """
     Parse HTML content and create a DOMHashMap similar to the original JavaScript function.
@@ -51,75 +77,59 @@ def parse_dom(html_content: str) -> DOMHashMap:
         A dictionary mapping node IDs to DOMNode objects
     """
     try:
-        logger.debug("Starting DOM parsing")
         dom_hash_map = {}
         current_id = 0
 
         soup = BeautifulSoup(html_content, 'html.parser')
 
-        def process_node(node, parent_id=None):
+        def process_node(node, xpath):
+            """Convert one node into the hash map, returning its id or -1 and the element node (if any)."""
             nonlocal current_id
 
             try:
                 if node is None:
-                    logger.debug("Skipping null node")
-                    return -1
+                    return -1, None
 
                 node_id = current_id
                 current_id += 1
 
-                logger.debug(f"Processing node {node_id}, type: {type(node)}")
-
                 if isinstance(node, NavigableString):
                     text = node.strip()
                     if not text:
-                        logger.debug("Skipping empty text node")
-                        return -1
+                        return -1, None
 
                     is_visible = is_text_node_visible(node)
-                    logger.debug(
-                        f"Text node: \"{text[:20]}{'...' if len(text) > 20 else ''}\", visible: {is_visible}")
 
                     dom_hash_map[str(node_id)] = DOMTextNode(
                         text=text,
                         isVisible=is_visible
                     )
 
-                    return node_id
+                    return node_id, None
 
                 if isinstance(node, Tag):
-                    tag_name = node.name.lower()
-                    logger.debug(f"Element node: <{tag_name}>")
+                    tag_name = _intern(node.name.lower())
 
                     attributes = {}
                     try:
                         if node.attrs:
                             for attr_name, attr_value in node.attrs.items():
                                 if isinstance(attr_value, list):
-                                    attributes[attr_name] = " ".join(
+                                    attributes[_intern(attr_name)] = " ".join(
                                         attr_value)
                                 else:
-                                    attributes[attr_name] = str(attr_value)
-                        logger.debug(f"Extracted {len(attributes)} attributes")
+                                    attributes[_intern(attr_name)] = str(attr_value)
                     except Exception as attr_error:
                         logger.error(
                             f"Error extracting attributes: {attr_error}")
 
-                    xpath = ""
-                    try:
-                        xpath = get_xpath_for_element(node)
-                        logger.debug(f"Generated XPath: {xpath}")
-                    except Exception as xpath_error:
-                        logger.error(f"Error generating XPath: {xpath_error}")
+                    if not xpath:
                         xpath = f"/{tag_name}"  # Fallback
 
                     is_interactive = is_interactive_element(node)
                     is_visible = is_element_visible(node)
                     is_top = is_top_element(node)
 
-                    logger.debug(
-                        f"Element properties - interactive: {is_interactive}, visible: {is_visible}, top: {is_top}")
-
                     element_node = DOMElementNode(
                         tagName=tag_name,
                         attributes=attributes,
@@ -132,34 +142,38 @@ def parse_dom(html_content: str) -> DOMHashMap:
 
                     dom_hash_map[str(node_id)] = element_node
 
-                    try:
-                        logger.debug(
-                            f"Processing {len(list(node.children))} children for {tag_name}")
-                        for child in node.children:
-                            child_id = process_node(child, node_id)
-                            if child_id != -1:
-                                element_node.children.append(child_id)
-                    except Exception as child_error:
-                        logger.error(
-                            f"Error processing children of {tag_name}: {child_error}")
-
-                    return node_id
+                    return node_id, element_node
 
-                return -1  # Should never reach here
+                return -1, None  # Should never reach here
             except Exception as process_error:
                 logger.error(f"Error processing node: {process_error}")
-                return -1
+                return -1, None
 
-        # Start processing from the body element
-        root_id = -1
+        # Start processing from the body element. The walk uses an explicit
+        # stack so deeply nested pages cannot hit the recursion limit; children
+        # are pushed in reverse so ids are still assigned in document order.
+        # XPaths are built top-down: only the root walks up the tree, every
+        # other element extends its parent's path with its sibling index.
         if soup.body:
-            logger.debug("Starting processing from document body")
-            root_id = process_node(soup.body)
+            stack = [(soup.body, None, get_xpath_for_element(soup.body))]
+            pop = stack.pop
+            push = stack.extend
+            while stack:
+                node, parent_node, xpath = pop()
+                node_id, element_node = process_node(node, xpath)
+                if node_id == -1:
+                    continue
+                if parent_node is not None:
+                    parent_node.children.append(node_id)
+                if element_node is not None:
+                    try:
+                        push(reversed(_child_frames(node, element_node, element_node.xpath)))
+                    except Exception as child_error:
+                        logger.error(
+                            f"Error processing children of {element_node.tagName}: {child_error}")
         else:
             logger.error("Document body not available")
 
-        logger.debug(
-            f"DOM parsing complete, created {len(dom_hash_map)} entries")
         return dom_hash_map
     except Exception as error:
         logger.error(f"Fatal error in parse_dom: {error}")
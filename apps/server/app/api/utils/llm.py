@@ -1,24 +1,59 @@
-import base64
+import asyncio
 import json
+import logging
 import os
-import re
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
+import orjson
 from google import genai
 from google.genai import types
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
 
-from openai import AsyncOpenAI, OpenAI
+from openai import OpenAI
 
 from dotenv import load_dotenv
 
+from app.config import settings
+
 load_dotenv()
 
+logger = logging.getLogger("llm")
+
+# One client per process so every request reuses its connection pool
 client = genai.Client(
     api_key=os.environ.get("GEMINI_API_KEY"),
+    http_options=types.HttpOptions(timeout=settings.GEMINI_HTTP_TIMEOUT),
 )
 
+_open_router_client: Optional[OpenAI] = None
+
+
+def _get_open_router_client() -> OpenAI:
+    """Create the OpenRouter client on first use; most deployments never call it."""
+    global _open_router_client
+    if _open_router_client is None:
+        _open_router_client = OpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=os.environ.get("OPENROUTER_API_KEY"),
+        )
+    return _open_router_client
+
+
+async def close_clients():
+    """Release the LLM clients' pooled connections."""
+    aclose = getattr(client.aio, "aclose", None)
+    if aclose is not None:
+        await aclose()
+    if _open_router_client is not None:
+        _open_router_client.close()
+
+
 class Action(BaseModel):
+    # Not frozen: process_element_references fills in xpath_ref and selector
+    model_config = ConfigDict(extra="ignore")
+
     type: str
     element_id: Optional[str] = None
     xpath_ref: Optional[str] = None
@@ -28,16 +63,78 @@ class Action(BaseModel):
     url: Optional[str] = None
 
 class CurrentState(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     page_summary: str
     evaluation_previous_goal: str
     next_goal: str
 
 class GenerateResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     current_state: CurrentState
     actions: List[Action]
     is_done: bool
 
-def parse_json_from_text(text):
+class _JsonObjectScanner:
+    """Tracks brace balance across chunks of text to find where the first JSON object ends."""
+
+    def __init__(self, open_char='{', close_char='}'):
+        # Pass '[' and ']' to find the end of a top-level JSON array instead
+        self.open_char = open_char
+        self.close_char = close_char
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text) -> int:
+        """Scan the next chunk; return the index just past the closing brace, or -1."""
+        open_char = self.open_char
+        close_char = self.close_char
+        i = 0
+        if not self.started:
+            i = text.find(open_char)
+            if i == -1:
+                return -1
+            self.started = True
+        
+        depth = self.depth
+        in_string = self.in_string
+        escaped = self.escaped
+        for i in range(i, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == open_char:
+                depth += 1
+            elif char == close_char:
+                depth -= 1
+                if depth == 0:
+                    self.depth, self.in_string, self.escaped = depth, in_string, escaped
+                    return i + 1
+        
+        self.depth, self.in_string, self.escaped = depth, in_string, escaped
+        return -1
+
+
+def _find_json_object(text) -> Optional[str]:
+    """Return the first balanced {...} fragment in text, skipping braces inside strings."""
+    start = text.find('{')
+    if start == -1:
+        return None
+    end = _JsonObjectScanner().feed(text[start:])
+    return text[start:start + end] if end != -1 else None
+
+
+def _repair_json(text):
     """Extract and parse JSON from text, handling potential formatting issues."""
     # Clean the text
     text = text.strip()
@@ -52,16 +149,14 @@ def parse_json_from_text(text):
     
     # Try to parse the clean text
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        json_pattern = r'\{[\s\S]*\}'
-        match = re.search(json_pattern, text)
+        return orjson.loads(text)
+    except (orjson.JSONDecodeError, json.JSONDecodeError):
+        json_candidate = _find_json_object(text)
         
-        if match:
-            json_candidate = match.group(0)
+        if json_candidate:
             try:
-                return json.loads(json_candidate)
-            except json.JSONDecodeError:
+                return orjson.loads(json_candidate)
+            except (orjson.JSONDecodeError, json.JSONDecodeError):
                 pass
     
     return {
@@ -75,175 +170,426 @@ def parse_json_from_text(text):
     }
 
 
-def generate(user_prompt, system_prompt) -> GenerateResponse:
+# Malformed LLM text -> its repaired JSON, so a retry that returns the same
+# text skips the repair. Results are stored serialized so every hit hands
+# back a fresh dict the caller is free to mutate.
+_REPAIRED_JSON_CACHE_SIZE = 256
+_repaired_json: "OrderedDict[str, bytes]" = OrderedDict()
 
-    model = "gemini-2.5-pro-exp-03-25"
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_text(
-                    text=user_prompt
-                ),
-            ],
-        ),
-    ]
-    generate_content_config = types.GenerateContentConfig(
-        temperature=0.3,
-        top_p=0.95,
-        top_k=64,
-        max_output_tokens=8192,
-        response_mime_type="application/json",
-        response_schema=genai.types.Schema(
+
+def parse_json_from_text(text):
+    """Parse JSON from LLM output, repairing fences and surrounding chatter if needed."""
+    # Fast path: the text is usually already a bare JSON object
+    if text and text[0] == '{' and text[-1] == '}':
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    
+    cached = _repaired_json.get(text)
+    if cached is not None:
+        _repaired_json.move_to_end(text)
+        return orjson.loads(cached)
+    
+    parsed = _repair_json(text)
+    _repaired_json[text] = orjson.dumps(parsed)
+    if len(_repaired_json) > _REPAIRED_JSON_CACHE_SIZE:
+        _repaired_json.popitem(last=False)
+    return parsed
+
+
+MODEL = "gemini-2.5-pro-exp-03-25"
+
+# The response schema and sampling settings never change between calls, so
+# they are built once; generate() only swaps in the system instruction.
+_RESPONSE_SCHEMA = genai.types.Schema(
+    type=genai.types.Type.OBJECT,
+    enum=[],
+    required=["current_state", "actions", "is_done"],
+    properties={
+        "current_state": genai.types.Schema(
             type=genai.types.Type.OBJECT,
             enum=[],
-            required=["current_state", "actions", "is_done"],
+            required=["page_summary",
+                      "evaluation_previous_goal", "next_goal"],
             properties={
-                "current_state": genai.types.Schema(
-                    type=genai.types.Type.OBJECT,
-                    enum=[],
-                    required=["page_summary",
-                              "evaluation_previous_goal", "next_goal"],
-                    properties={
-                        "page_summary": genai.types.Schema(
-                            type=genai.types.Type.STRING,
-                        ),
-                        "evaluation_previous_goal": genai.types.Schema(
-                            type=genai.types.Type.STRING,
-                        ),
-                        "next_goal": genai.types.Schema(
-                            type=genai.types.Type.STRING,
-                        ),
-                    },
+                "page_summary": genai.types.Schema(
+                    type=genai.types.Type.STRING,
                 ),
-                "actions": genai.types.Schema(
-                    type=genai.types.Type.ARRAY,
-                    items=genai.types.Schema(
-                        type=genai.types.Type.OBJECT,
-                        enum=[],
-                        required=["type"],
-                        properties={
-                            "type": genai.types.Schema(
-                                type=genai.types.Type.STRING,
-                            ),
-                            "element_id": genai.types.Schema(
-                                type=genai.types.Type.STRING,
-                            ),
-                            "xpath_ref": genai.types.Schema(
-                                type=genai.types.Type.STRING,
-                            ),
-                            "selector": genai.types.Schema(
-                                type=genai.types.Type.STRING,
-                            ),
-                            "text": genai.types.Schema(
-                                type=genai.types.Type.STRING,
-                            ),
-                            "amount": genai.types.Schema(
-                                type=genai.types.Type.INTEGER,
-                            ),
-                            "url": genai.types.Schema(
-                                type=genai.types.Type.STRING,
-                            ),
-                        },
-                    ),
+                "evaluation_previous_goal": genai.types.Schema(
+                    type=genai.types.Type.STRING,
                 ),
-                "is_done": genai.types.Schema(
-                    type=genai.types.Type.BOOLEAN,
+                "next_goal": genai.types.Schema(
+                    type=genai.types.Type.STRING,
                 ),
             },
         ),
-        system_instruction=[
-            types.Part.from_text(
-                text=system_prompt
+        "actions": genai.types.Schema(
+            type=genai.types.Type.ARRAY,
+            items=genai.types.Schema(
+                type=genai.types.Type.OBJECT,
+                enum=[],
+                required=["type"],
+                properties={
+                    "type": genai.types.Schema(
+                        type=genai.types.Type.STRING,
+                    ),
+                    "element_id": genai.types.Schema(
+                        type=genai.types.Type.STRING,
+                    ),
+                    "xpath_ref": genai.types.Schema(
+                        type=genai.types.Type.STRING,
+                    ),
+                    "selector": genai.types.Schema(
+                        type=genai.types.Type.STRING,
+                    ),
+                    "text": genai.types.Schema(
+                        type=genai.types.Type.STRING,
+                    ),
+                    "amount": genai.types.Schema(
+                        type=genai.types.Type.INTEGER,
+                    ),
+                    "url": genai.types.Schema(
+                        type=genai.types.Type.STRING,
+                    ),
+                },
             ),
-        ],
-    )
+        ),
+        "is_done": genai.types.Schema(
+            type=genai.types.Type.BOOLEAN,
+        ),
+    },
+)
+
+_BASE_GENERATE_CONFIG = types.GenerateContentConfig(
+    temperature=0.3,
+    top_p=0.95,
+    top_k=64,
+    max_output_tokens=8192,
+    response_mime_type="application/json",
+    response_schema=_RESPONSE_SCHEMA,
+    http_options=types.HttpOptions(timeout=settings.GEMINI_STREAM_TIMEOUT),
+)
+
+
+# System prompt -> (cache name, monotonic expiry); a None name means caching
+# failed for that prompt and requests fall back to sending it inline
+_system_prompt_caches: Dict[str, Tuple[Optional[str], float]] = {}
+_system_prompt_caches_lock = asyncio.Lock()
+
+
+async def _get_system_prompt_cache(system_prompt) -> Optional[str]:
+    """Return a Gemini context cache holding the system prompt, created once per TTL."""
+    if not settings.GEMINI_CACHE_ENABLED:
+        return None
+    
+    async with _system_prompt_caches_lock:
+        cached = _system_prompt_caches.get(system_prompt)
+        if cached and time.monotonic() < cached[1]:
+            return cached[0]
+        
+        ttl = settings.GEMINI_CACHE_TTL
+        try:
+            cache = await client.aio.caches.create(
+                model=MODEL,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    ttl=f"{ttl}s",
+                ),
+            )
+            cache_name = cache.name
+        except Exception as e:
+            # e.g. the prompt is below the model's minimum cacheable size
+            logger.warning("Could not create Gemini context cache: %s", e)
+            cache_name = None
+        
+        # Renew a minute early so a request never races the server-side expiry
+        _system_prompt_caches[system_prompt] = (cache_name, time.monotonic() + max(ttl - 60, 0))
+        return cache_name
+
+
+def _drop_system_prompt_cache(system_prompt):
+    """Forget a context cache the API rejected so the next call recreates it."""
+    _system_prompt_caches.pop(system_prompt, None)
+
+
+def _parse_or_repair(text) -> GenerateResponse:
+    """Validate the LLM's JSON straight from the string, repairing it only if that fails."""
+    try:
+        return GenerateResponse.model_validate_json(text)
+    except ValidationError:
+        logger.warning("LLM returned invalid JSON. Attempting to fix...")
+        return GenerateResponse.model_validate(parse_json_from_text(text))
+
+
+async def _stream_response(contents, config, scanner=None) -> Tuple[str, Optional[types.GenerateContentResponseUsageMetadata]]:
+    """
+    Stream a Gemini response and stop reading once its top-level JSON value
+    is complete, so validation starts without waiting for the stream to end.
+    
+    Gemini sends the token counts with the final chunk, so a stream closed
+    early usually yields no usage_metadata. They are only logged at debug
+    level; when debug logging is enabled the rest of the stream is still
+    read for them, and its text is discarded.
     
-    # Make the API call
-    response = client.models.generate_content(
-        model=model,
+    Returns:
+        Tuple of (response_text, usage_metadata), usage_metadata may be None
+    """
+    parts = []
+    usage_metadata = None
+    if scanner is None:
+        scanner = _JsonObjectScanner()
+    stream = await client.aio.models.generate_content_stream(
+        model=MODEL,
         contents=contents,
-        config=generate_content_config,
+        config=config,
     )
-    print(response.text)
-    print(response.usage_metadata)
+    async for chunk in stream:
+        usage_metadata = chunk.usage_metadata or usage_metadata
+        text = chunk.text
+        if not text:
+            continue
+        end = scanner.feed(text)
+        if end != -1:
+            parts.append(text[:end])
+            if logger.isEnabledFor(logging.DEBUG):
+                async for chunk in stream:
+                    usage_metadata = chunk.usage_metadata or usage_metadata
+            # Close the stream early; the rest is whitespace or trailing chatter
+            elif hasattr(stream, 'aclose'):
+                await stream.aclose()
+            break
+        parts.append(text)
+    return ''.join(parts), usage_metadata
+
+
+async def _request(user_prompt, system_prompt, config_update=None, scanner_factory=_JsonObjectScanner) -> str:
+    """Send one prompt to Gemini, reusing the cached system prompt when available."""
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(
+                    text=user_prompt
+                ),
+            ],
+        ),
+    ]
+    
+    # Make the API call without blocking the event loop, reusing the cached
+    # system prompt when available
+    response_text = None
+    cache_name = await _get_system_prompt_cache(system_prompt)
+    if cache_name:
+        try:
+            response_text, usage_metadata = await _stream_response(
+                contents,
+                _BASE_GENERATE_CONFIG.model_copy(update={**(config_update or {}), "cached_content": cache_name}),
+                scanner_factory(),
+            )
+        except Exception as e:
+            logger.warning("Cached Gemini request failed, retrying without cache: %s", e)
+            _drop_system_prompt_cache(system_prompt)
+    
+    if response_text is None:
+        generate_content_config = _BASE_GENERATE_CONFIG.model_copy(update={
+            **(config_update or {}),
+            "system_instruction": [
+                types.Part.from_text(
+                    text=system_prompt
+                ),
+            ],
+        })
+        response_text, usage_metadata = await _stream_response(
+            contents, generate_content_config, scanner_factory())
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("resp=%s meta=%s", response_text, usage_metadata)
+    return response_text
+
+
+def _fallback_response() -> GenerateResponse:
+    return GenerateResponse.model_validate({
+        "current_state": {
+            "page_summary": "Error processing LLM response.",
+            "evaluation_previous_goal": "Unknown",
+            "next_goal": "Please try again"
+        },
+        "actions": [],
+        "is_done": False
+    })
+
+
+async def _generate_single(user_prompt, system_prompt) -> GenerateResponse:
+    response_text = await _request(user_prompt, system_prompt)
     
     try:
-        json_response = json.loads(response.text)
-        return GenerateResponse.model_validate(json_response)
-    except json.JSONDecodeError:
-        print("Warning: LLM returned invalid JSON. Attempting to fix...")
-        fixed_json = parse_json_from_text(response.text)
-        return GenerateResponse.model_validate(fixed_json)
-    except Exception as e:
-        print(f"Error processing response: {e}")
+        return _parse_or_repair(response_text)
+    except Exception:
+        logger.exception("Error processing response")
         # Return a fallback JSON response
-        fallback = {
+        return _fallback_response()
+
+
+_BATCH_CONFIG_UPDATE = {
+    "response_schema": genai.types.Schema(
+        type=genai.types.Type.ARRAY,
+        items=_RESPONSE_SCHEMA,
+    ),
+}
+
+_BATCH_RESPONSES = TypeAdapter(List[GenerateResponse])
+
+
+def _array_scanner() -> _JsonObjectScanner:
+    return _JsonObjectScanner('[', ']')
+
+
+def _build_batch_prompt(user_prompts) -> str:
+    parts = [
+        f"You are handling {len(user_prompts)} independent browser sessions at once. "
+        f"Respond with a JSON array of exactly {len(user_prompts)} objects, one per item "
+        "in the order given, each in the usual response format.\n\n"
+    ]
+    for i, user_prompt in enumerate(user_prompts):
+        parts.append(f"### ITEM {i}\n{user_prompt}\n\n")
+    return "".join(parts)
+
+
+class GenerateBatcher:
+    """
+    Coalesces concurrent generate() calls for the same task that share a
+    system prompt into a single Gemini request returning one response per
+    caller. Prompts from different tasks never share a request, so one
+    task's page content is never shown to the model alongside another's.
+    """
+
+    def __init__(self, max_size, window):
+        self.max_size = max_size
+        self.window = window
+        # (system prompt, task id) -> [(user_prompt, future)] waiting for the next flush
+        self._pending: Dict[Tuple[str, str], List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        # The event loop only keeps weak references to tasks
+        self._tasks = set()
+
+    async def submit(self, user_prompt, system_prompt, task_id) -> GenerateResponse:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (system_prompt, task_id)
+        group = self._pending.setdefault(key, [])
+        group.append((user_prompt, future))
+        
+        if len(group) >= self.max_size:
+            self._flush(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        items = self._pending.pop(key, None)
+        if items:
+            task = asyncio.ensure_future(self._dispatch(key[0], items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, system_prompt, items):
+        try:
+            if len(items) == 1:
+                results = [await _generate_single(items[0][0], system_prompt)]
+            else:
+                results = await self._generate_batch(system_prompt, [item[0] for item in items])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _generate_batch(self, system_prompt, user_prompts) -> List[GenerateResponse]:
+        try:
+            response_text = await _request(
+                _build_batch_prompt(user_prompts), system_prompt,
+                _BATCH_CONFIG_UPDATE, _array_scanner)
+            results = _BATCH_RESPONSES.validate_json(response_text)
+            if len(results) == len(user_prompts):
+                return results
+            logger.warning("Batched response had %d items for %d prompts", len(results), len(user_prompts))
+        except Exception as e:
+            logger.warning("Batched Gemini request failed, sending items individually: %s", e)
+        
+        return await asyncio.gather(
+            *(_generate_single(user_prompt, system_prompt) for user_prompt in user_prompts))
+
+
+_batcher = GenerateBatcher(settings.LLM_BATCH_SIZE, settings.LLM_BATCH_WINDOW)
+
+
+async def generate(user_prompt, system_prompt, task_id: Optional[str] = None) -> GenerateResponse:
+    # Only calls that name their task can be batched, and only with that task's calls
+    if _batcher.max_size > 1 and task_id is not None:
+        return await _batcher.submit(user_prompt, system_prompt, task_id)
+    return await _generate_single(user_prompt, system_prompt)
+
+
+# JSON schema sent to OpenRouter; mirrors _RESPONSE_SCHEMA
+_OPENROUTER_RESPONSE_FORMAT = {
+    "type": "json_object",
+    "schema": {
+        "type": "object",
+        "properties": {
             "current_state": {
-                "page_summary": "Error processing LLM response.",
-                "evaluation_previous_goal": "Unknown",
-                "next_goal": "Please try again"
+                "type": "object",
+                "properties": {
+                    "page_summary": {"type": "string"},
+                    "evaluation_previous_goal": {"type": "string"},
+                    "next_goal": {"type": "string"}
+                },
+                "required": ["page_summary", "evaluation_previous_goal", "next_goal"]
             },
-            "actions": [],
-            "is_done": False
-        }
-        return GenerateResponse.model_validate(fallback)
+            "actions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "type": {"type": "string"},
+                        "element_id": {"type": "string"},
+                        "xpath_ref": {"type": "string"},
+                        "selector": {"type": "string"},
+                        "text": {"type": "string"},
+                        "amount": {"type": "integer"},
+                        "url": {"type": "string"}
+                    },
+                    "required": ["type"]
+                }
+            },
+            "is_done": {"type": "boolean"}
+        },
+        "required": ["current_state", "actions", "is_done"]
+    }
+}
 
 
-# generate()
-# client = OpenAI(
-#     base_url="https://openrouter.ai/api/v1",
-#     api_key=os.environ.get("OPENROUTER_API_KEY"),
-# )
 def generate_with_open_router(user_prompt, system_prompt) -> GenerateResponse:
-    response = client.chat.completions.create(
+    response = _get_open_router_client().chat.completions.create(
         model="deepseek/deepseek-r1:free",
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ],
-        response_format={
-            "type": "json_object",
-            "schema": {
-                "type": "object",
-                "properties": {
-                    "current_state": {
-                        "type": "object",
-                        "properties": {
-                            "page_summary": {"type": "string"},
-                            "evaluation_previous_goal": {"type": "string"},
-                            "next_goal": {"type": "string"}
-                        },
-                        "required": ["page_summary", "evaluation_previous_goal", "next_goal"]
-                    },
-                    "actions": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "type": {"type": "string"},
-                                "element_id": {"type": "string"},
-                                "xpath_ref": {"type": "string"},
-                                "selector": {"type": "string"},
-                                "text": {"type": "string"},
-                                "amount": {"type": "integer"},
-                                "url": {"type": "string"}
-                            },
-                            "required": ["type"]
-                        }
-                    },
-                    "is_done": {"type": "boolean"}
-                },
-                "required": ["current_state", "actions", "is_done"]
-            }
-        }
+        response_format=_OPENROUTER_RESPONSE_FORMAT,
     )
     
     try:
         json_response = response.choices[0].message.content
         return GenerateResponse.model_validate(json.loads(json_response))
-    except Exception as e:
-        print(f"Error processing response: {e}")
+    except Exception:
+        logger.exception("Error processing response")
         fallback = {
             "current_state": {
                 "page_summary": "Error processing LLM response.",
@@ -1,10 +1,11 @@
-from typing import Dict, List, Optional
+from functools import lru_cache
 
-from app.api.utils.dom_parser.dom_optimizer import generate_highlight_style_dom
-from app.api.utils.dom_parser.optimizer2 import generate_fixed_highlight_dom
 from app.api.utils.dom_parser.optimizer3 import generate_enhanced_highlight_dom
-from app.models.dom import DOMState
 
+# Attributes shown next to each interactive element in the prompt
+_KEY_ATTRIBUTES = ('id', 'name', 'type', 'value', 'placeholder', 'href')
+
+@lru_cache(maxsize=1)
 def build_system_prompt():
     prompt = """You are an AI browser named Navigator AI. You are an automation assistant designed to help users accomplish tasks on websites. Your goal is to accurately interact with web elements to complete the user's ultimate task.
 
@@ -61,31 +62,29 @@ def build_user_message(dom_state, task=None, history=None, result=None):
     Returns:
         Tuple of (content, xpath_map, selector_map)
     """
-    key_attributes = ['id', 'name', 'type', 'value', 'placeholder', 'href']
-    
     dom_content, xpath_map, selector_map = generate_enhanced_highlight_dom(
-        dom_state, include_attributes=key_attributes)
+        dom_state, include_attributes=_KEY_ATTRIBUTES)
     
-    content = ""
+    parts = []
     
     if task:
-        content += f"MAIN TASK (END GOAL): {task}\n\n"
+        parts.append(f"MAIN TASK (END GOAL): {task}\n\n")
     
-    content += f"CURRENT URL: {dom_state.url}\n\n"
+    parts.append(f"CURRENT URL: {dom_state.url}\n\n")
     
-    content += "INTERACTIVE ELEMENTS:\n"
-    content += "(Only elements with [E#] IDs can be interacted with)\n"
-    content += f"{dom_content}\n"
+    parts.append("INTERACTIVE ELEMENTS:\n")
+    parts.append("(Only elements with [E#] IDs can be interacted with)\n")
+    parts.append(f"{dom_content}\n")
     
     if history and len(history) > 0:
-        content += "\nACTION HISTORY:\n"
+        parts.append("\nACTION HISTORY:\n")
         
         for i, step in enumerate(history):
             if not isinstance(step, dict):
                 print(f"Warning: Invalid history step format: {type(step)}")
                 continue
                 
-            content += f"Step {i+1}: URL: {step.get('url', 'unknown')}\n"
+            parts.append(f"Step {i+1}: URL: {step.get('url', 'unknown')}\n")
             actions = step.get('actions', [])
             
             if not actions:
@@ -104,29 +103,37 @@ def build_user_message(dom_state, task=None, history=None, result=None):
                     print(f"Warning: Invalid action format in step {i+1}: {type(action)}")
                     continue
                     
-                action_str = f"  - {action.get('type', '').upper()}"
+                # Stored actions carry every field, unset ones as None
+                get = action.get
+                element_id = get('element_id')
+                selector = get('selector')
+                text = get('text')
+                url = get('url')
+                amount = get('amount')
+                
+                parts.append(f"  - {(get('type') or '').upper()}")
                 
-                if 'element_id' in action:
-                    action_str += f" element [{action['element_id']}]"
-                elif 'xpath_ref' in action and 'selector' in action:
-                    action_str += f" element with selector: {action['selector']}"
+                if element_id:
+                    parts.append(f" element [{element_id}]")
+                elif selector and get('xpath_ref'):
+                    parts.append(f" element with selector: {selector}")
                 
-                if 'text' in action and action['text']:
-                    action_str += f" with text: '{action['text']}'"
-                if 'url' in action and action['url']:
-                    action_str += f" to URL: {action['url']}"
-                if 'amount' in action:
-                    action_str += f" by {action['amount']} pixels"
+                if text:
+                    parts.append(f" with text: '{text}'")
+                if url:
+                    parts.append(f" to URL: {url}")
+                if amount is not None:
+                    parts.append(f" by {amount} pixels")
                 
-                content += action_str + "\n"
-            content += "\n"
+                parts.append("\n")
+            parts.append("\n")
     
     if result:
-        content += f"RESULT OF LAST ACTION:\n{result}\n"
+        parts.append(f"RESULT OF LAST ACTION:\n{result}\n")
         
-    content += "\nREMINDERS:\n"
-    content += "- Use EXACT element IDs (E1, E2, etc.) as shown above\n"
-    content += "- For input actions, include both element_id and text\n"
-    content += "- Only set is_done:true when the entire task is complete\n"
+    parts.append("\nREMINDERS:\n"
+                 "- Use EXACT element IDs (E1, E2, etc.) as shown above\n"
+                 "- For input actions, include both element_id and text\n"
+                 "- Only set is_done:true when the entire task is complete\n")
     
-    return content, xpath_map, selector_map
\ No newline at end of file
+    return "".join(parts), xpath_map, selector_map
\ No newline at end of file
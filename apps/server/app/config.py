@@ -1,11 +1,17 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
 
 
 class Settings(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     APP_NAME: str = "Navigator AI API"
     DEBUG: bool = True
     API_PREFIX: str = ""
     SNAPSHOTS_DIR: str = "dom_snapshots"
+    METADATA_WRITE_BATCH_SIZE: int = 100
+    METADATA_FLUSH_INTERVAL: float = 0.05  # seconds
 
     # Redis settings
     REDIS_HOST: str = "localhost"
@@ -17,14 +23,29 @@ class Settings(BaseModel):
     REDIS_TASK_HISTORY_PREFIX: str = "task_history:"
     REDIS_TASK_TTL: int = 60 * 60 * 24  # 24 hours
 
+    # Gemini settings
+    # Client-wide timeout; None waits for as long as the API takes
+    GEMINI_HTTP_TIMEOUT: Optional[int] = None  # milliseconds
+    # Streamed generations opt into their own timeout. httpx applies it to every
+    # read, including the wait for the first chunk, so it has to cover a thinking
+    # model's silence before it starts emitting
+    GEMINI_STREAM_TIMEOUT: Optional[int] = 300 * 1000  # milliseconds
+
+    # Gemini context caching of the system prompt
+    GEMINI_CACHE_ENABLED: bool = False
+    GEMINI_CACHE_TTL: int = 60 * 60  # 1 hour
+
+    # Coalesce concurrent LLM calls into one request; 1 disables batching.
+    # Only calls for the same task are combined, since every prompt in a batch
+    # is sent to the model in one request
+    LLM_BATCH_SIZE: int = 1
+    LLM_BATCH_WINDOW: float = 0.03  # seconds
+
     # CORS settings
     CORS_ORIGINS: list[str] = ["*"]
     CORS_ALLOW_CREDENTIALS: bool = True
     CORS_ALLOW_METHODS: list[str] = ["*"]
     CORS_ALLOW_HEADERS: list[str] = ["*"]
 
-    class Config:
-        env_file = ".env"
-
 
 settings = Settings()
@@ -1,13 +1,31 @@
+from contextlib import asynccontextmanager
+
 from app.api.router import api_router
+from app.api.services.storage_service import StorageService
+from app.api.utils.llm import close_clients
 from app.config import settings
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    StorageService.start_metadata_writer()
+    yield
+    await StorageService.stop_metadata_writer()
+    await StorageService.close_redis()
+    await close_clients()
+
 
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     openapi_url=f"{settings.API_PREFIX}/openapi.json",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Set up CORS middleware
@@ -19,5 +37,8 @@ app.add_middleware(
     allow_headers=settings.CORS_ALLOW_HEADERS,
 )
 
+# Compress large responses such as parsed DOM maps
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_PREFIX)
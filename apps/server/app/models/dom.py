@@ -1,7 +1,10 @@
+import sys
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Literal, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+
+_intern = sys.intern
 
 
 class DOMData(BaseModel):
@@ -12,11 +15,15 @@ class DOMData(BaseModel):
 
 
 class DOMCoordinates(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     x: float
     y: float
 
 
 class CoordinateSet(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     topLeft: DOMCoordinates
     topRight: DOMCoordinates
     bottomLeft: DOMCoordinates
@@ -27,6 +34,8 @@ class CoordinateSet(BaseModel):
 
 
 class ViewportInfo(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     scrollX: float
     scrollY: float
     width: float
@@ -34,6 +43,8 @@ class ViewportInfo(BaseModel):
 
 
 class DOMElementNode(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     tagName: str
     attributes: Dict[str, str]
     xpath: str
@@ -47,9 +58,17 @@ class DOMElementNode(BaseModel):
     pageCoordinates: Optional[CoordinateSet] = None
     viewport: Optional[ViewportInfo] = None
 
+    @field_validator("attributes")
+    @classmethod
+    def intern_attributes(cls, value: Dict[str, str]) -> Dict[str, str]:
+        """Intern attribute names and short values, which repeat across thousands of nodes"""
+        return {_intern(k): _intern(v) if len(v) < 64 else v for k, v in value.items()}
+
 
 class DOMTextNode(BaseModel):
-    type: str = "TEXT_NODE"
+    model_config = ConfigDict(frozen=True)
+
+    type: Literal["TEXT_NODE"] = "TEXT_NODE"
     text: str
     isVisible: bool
 
@@ -78,3 +97,6 @@ class DOMState(BaseModel):
 
 DOMNode = Union[DOMElementNode, DOMTextNode]
 DOMHashMap = Dict[str, DOMNode]
+
+# Built once at import; reused to serialize every parsed DOM
+DOM_HASH_MAP_ADAPTER = TypeAdapter(DOMHashMap)
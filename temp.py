@@ -1,4 +1,5 @@
 import os
+import shutil
 
 
 def write_extension_code_to_file(extension_dir, output_file):
@@ -9,37 +10,35 @@ def write_extension_code_to_file(extension_dir, output_file):
         extension_dir (str): Path to the extension directory
         output_file (str): Path to the output text file
     """
+    # Directories to skip, and the files worth including
+    ignored_dirs = {'node_modules', 'dist', '.git'}
+    valid_extensions = {'.ts', '.tsx', '.js',
+                        '.jsx', '.html', '.css', '.py'}
+    invalid_files = {'package-lock.json'}
+
     with open(output_file, 'w', encoding='utf-8') as outfile:
         for root, dirs, files in os.walk(extension_dir):
-            for file in files:
-                # Skip node_modules, dist, and other common directories to ignore
-                if any(ignore in root for ignore in ['node_modules', 'dist', '.git']):
-                    continue
+            # Prune ignored directories so os.walk never descends into them
+            dirs[:] = [d for d in dirs if d not in ignored_dirs]
 
+            for file in files:
                 # Get file extension
                 _, file_ext = os.path.splitext(file)
 
-                # List of file extensions to include
-                valid_extensions = ['.ts', '.tsx', '.js',
-                                    '.jsx', '.html', '.css', '.py']
-
-                invalid_files = ['package-lock.json']
-
                 if file_ext in valid_extensions and file not in invalid_files:
                     file_path = os.path.join(root, file)
                     relative_path = os.path.relpath(file_path, extension_dir)
 
                     try:
-                        with open(file_path, 'r', encoding='utf-8') as infile:
-                            content = infile.read()
-
+                        # Undecodable bytes are replaced so a bad file can't fail
+                        # partway through and leave a header with a partial body
+                        with open(file_path, 'r', encoding='utf-8', errors='replace') as infile:
                             # Write file header
-                            outfile.write(f"\n{'='*80}\n")
-                            outfile.write(f"File: {relative_path}\n")
-                            outfile.write(f"{'='*80}\n\n")
+                            outfile.write(
+                                f"\n{'='*80}\nFile: {relative_path}\n{'='*80}\n\n")
 
-                            # Write file content
-                            outfile.write(content)
+                            # Stream the file content instead of reading it whole
+                            shutil.copyfileobj(infile, outfile, length=65536)
                             outfile.write("\n\n")
                     except Exception as e:
                         outfile.write(